@@ -1,155 +1,364 @@
 import os
 import argparse
 import json
-import base64
 import re
-import urllib.request
+import sys
+import threading
 import time
-from datetime import datetime
+# base64, http.client and concurrent.futures are imported where they
+# are used, so runs that end up sending nothing never load them
 
 print("--- SCRIPT STARTED ---")
 
 # --- CONFIGURATION ---
-COLORS = {
-    "OPENED": 5763719,    # Green
-    "MERGED": 10181046,   # Purple
-    "CLOSED": 15548997,   # Red
-    "INFO": 3447003,      # Blue
-    "COMMENT": 16776960,  # Yellow
-    "APPROVED": 5763719,  # Green (Same as Open)
-    "CHANGES": 15548997   # Red (Same as Closed)
-}
+_COLOR_OPENED = _COLOR_APPROVED = 5763719    # Green
+_COLOR_CLOSED = _COLOR_CHANGES = 15548997    # Red
+_COLOR_MERGED = 10181046                     # Purple
+_COLOR_INFO = 3447003                        # Blue
+_COLOR_COMMENT = 16776960                    # Yellow
+
+# Parts shared by every embed; only copied shallowly, so never mutate them
+BASE_EMBED = {"footer": {"text": "GitHub Notification"}}
+
+_MENTION_RE = re.compile(r"@([a-zA-Z0-9-]+)")
+
+# --- DM CHANNEL CACHE ---
+# Discord returns the same DM channel for a user indefinitely, so within a
+# run we only ask for it once. RUNNER_TEMP is emptied between jobs, so the
+# ids are not persisted.
+_DM_CHANNEL_CACHE: dict[str, str] = {}
+
+# --- USER MAPPING ---
+def load_user_map(mapping_b64):
+    import base64
+
+    try:
+        decoded_json = base64.b64decode(mapping_b64).decode("utf-8")
+        return json.loads(decoded_json)
+    except Exception as e:
+        print(f"⚠️ Error decoding User Mapping: {e}")
+        return {}
 
 # --- DISCORD API HELPERS ---
-def send_dm(user_id, embed):
-    token = os.environ.get("DISCORD_BOT_TOKEN", "").strip()
-    if not token or not user_id:
-        print(f"⚠️ Missing token or user_id for {user_id}")
-        return
+API_HOST = "discord.com"
+API_BASE = "/api/v10"
+MAX_WORKERS = 5  # Well under Discord's 50 req/s global limit
+RATE_LIMIT_PER_SEC = 45
+MAX_RETRIES = 3
+MAX_RETRY_AFTER = 30  # Seconds; longer waits (global/Cloudflare bans) give up
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS_PER_MESSAGE = 6000
 
-    headers = {
-        "Authorization": f"Bot {token}",
-        "Content-Type": "application/json",
-        "User-Agent": "GitHub-Actions-Bot/1.0"
-    }
+# Read once at startup; main() refuses to send without a token
+_TOKEN = os.environ.get("DISCORD_BOT_TOKEN", "").strip()
+_HEADERS = {
+    "Authorization": f"Bot {_TOKEN}",
+    "Content-Type": "application/json",
+    "User-Agent": "GitHub-Actions-Bot/1.0"
+}
+
+# --- RATE LIMITING ---
+# Token bucket shared by all workers, refilled just below the global limit
+_bucket_lock = threading.Lock()
+_bucket_tokens = float(RATE_LIMIT_PER_SEC)
+_bucket_last = time.monotonic()
+
+def take_token():
+    global _bucket_tokens, _bucket_last
+    with _bucket_lock:
+        now = time.monotonic()
+        _bucket_tokens = min(RATE_LIMIT_PER_SEC, _bucket_tokens + (now - _bucket_last) * RATE_LIMIT_PER_SEC)
+        _bucket_last = now
+        if _bucket_tokens < 1:
+            time.sleep((1 - _bucket_tokens) / RATE_LIMIT_PER_SEC)
+            _bucket_tokens = 1.0
+            _bucket_last = time.monotonic()
+        _bucket_tokens -= 1
+
+def retry_after(resp, raw):
+    # Discord reports the precise wait in the JSON body, the header is rounded
+    try:
+        return float(json.loads(raw)["retry_after"])
+    except Exception:
+        pass
+    try:
+        return float(resp.getheader("Retry-After", 1))
+    except ValueError:
+        return 1.0
+
+# --- CONNECTIONS ---
+# http.client connections are not thread-safe, so each worker keeps its own
+# keep-alive connection for the whole run
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+
+def get_conn():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        import http.client
+
+        conn = _local.conn = http.client.HTTPSConnection(API_HOST, timeout=10)
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
+
+def close_connections():
+    with _connections_lock:
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+
+class DiscordAPIError(Exception):
+    def __init__(self, status, body):
+        super().__init__(f"HTTP {status}: {body}")
+        self.status = status
+
+def _post(conn, path, body):
+    try:
+        conn.request("POST", API_BASE + path, body, _HEADERS)
+        resp = conn.getresponse()
+        return resp, resp.read()
+    except Exception:
+        # Drop the broken socket so the next call reconnects cleanly
+        conn.close()
+        raise
 
-    # 1. Create DM Channel
-    dm_url = "https://discord.com/api/v10/users/@me/channels"
+def send_request(path, body):
+    conn = get_conn()
+    reused = conn.sock is not None
     try:
-        req = urllib.request.Request(
-            dm_url,
-            data=json.dumps({"recipient_id": user_id}).encode("utf-8"),
-            headers=headers
-        )
-        resp = urllib.request.urlopen(req)
-        channel_id = json.loads(resp.read().decode())["id"]
+        return _post(conn, path, body)
+    except (ConnectionResetError, BrokenPipeError):
+        # Discord may close an idle keep-alive socket (rate-limit waits leave
+        # gaps of seconds); retry once on a fresh connection
+        if not reused:
+            raise
+    return _post(conn, path, body)
+
+def api_post(path, body):
+    for attempt in range(MAX_RETRIES + 1):
+        take_token()
+        resp, raw = send_request(path, body)
+
+        if resp.status == 429 and attempt < MAX_RETRIES:
+            delay = retry_after(resp, raw)
+            if delay > MAX_RETRY_AFTER:
+                raise DiscordAPIError(429, f"retry_after {delay:.0f}s exceeds {MAX_RETRY_AFTER}s")
+            print(f"⏳ Rate limited on {path}, retrying in {delay:.2f}s")
+            time.sleep(delay)
+            continue
+        if not 200 <= resp.status < 300:
+            raise DiscordAPIError(resp.status, raw.decode(errors="replace")[:200])
+        return json.loads(raw) if raw else None
+
+def get_dm_channel(user_id):
+    channel_id = _DM_CHANNEL_CACHE.get(user_id)
+    if channel_id:
+        return channel_id
+
+    body = json.dumps({"recipient_id": user_id}).encode("utf-8")
+    channel_id = api_post("/users/@me/channels", body)["id"]
+    _DM_CHANNEL_CACHE[user_id] = channel_id
+    return channel_id
+
+def send_message(user_id, body):
+    # 1. Get DM Channel
+    try:
+        channel_id = get_dm_channel(user_id)
     except Exception as e:
         print(f"❌ Could not open DM with {user_id}: {e}")
         return
 
     # 2. Send Message
-    msg_url = f"https://discord.com/api/v10/channels/{channel_id}/messages"
-    payload = {"embeds": [embed]}
-
     try:
-        req = urllib.request.Request(
-            msg_url,
-            data=json.dumps(payload).encode("utf-8"),
-            headers=headers
-        )
-        urllib.request.urlopen(req)
+        api_post(f"/channels/{channel_id}/messages", body)
         print(f"✅ DM sent to {user_id}")
     except Exception as e:
         print(f"❌ Failed to send message to {user_id}: {e}")
 
-# --- MAIN EXECUTION ---
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--mapping-b64", help="Base64 encoded user mapping string")
-    args = parser.parse_args()
+# handle_event only yields users with a mapped Discord ID
+def send_dm(user_id, bodies):
+    for body in bodies:
+        send_message(user_id, body)
 
-    # Load Mapping
-    user_map = {}
-    if args.mapping_b64:
-        try:
-            decoded_json = base64.b64decode(args.mapping_b64).decode("utf-8")
-            user_map = json.loads(decoded_json)
-        except Exception as e:
-            print(f"⚠️ Error decoding User Mapping: {e}")
+# Characters Discord counts towards its per-message total across all embeds
+def embed_size(embed):
+    size = len(embed.get("title", "")) + len(embed.get("description", ""))
+    size += len(embed.get("author", {}).get("name", ""))
+    size += len(embed.get("footer", {}).get("text", ""))
+    for field in embed.get("fields", ()):
+        size += len(field["name"]) + len(field["value"])
+    return size
 
-    # Load Event
-    if "GITHUB_EVENT_PATH" not in os.environ:
-        print("❌ Error: GITHUB_EVENT_PATH not set.")
-        return
+# Splits a user's embeds into messages, closing one at 10 embeds or 6000
+# counted characters, whichever comes first
+def chunk_embeds(embeds):
+    chunks = []
+    chunk, chunk_size = [], 0
+    for embed in embeds:
+        size = embed_size(embed)
+        if chunk and (len(chunk) == MAX_EMBEDS_PER_MESSAGE or chunk_size + size > MAX_EMBED_CHARS_PER_MESSAGE):
+            chunks.append(chunk)
+            chunk, chunk_size = [], 0
+        chunk.append(embed)
+        chunk_size += size
+    if chunk:
+        chunks.append(chunk)
+    return chunks
 
-    with open(os.environ["GITHUB_EVENT_PATH"]) as f:
-        event = json.load(f)
+# JSON-encodes each user's messages. A chunk fanned out to several users is
+# encoded once and its bytes shared.
+def encode_messages(per_user):
+    encoded = {}
+    per_user_bodies = {}
+    for user_id, embeds in per_user.items():
+        bodies = []
+        for chunk in chunk_embeds(embeds):
+            key = tuple(map(id, chunk))
+            if key not in encoded:
+                encoded[key] = json.dumps({"embeds": chunk}).encode("utf-8")
+            bodies.append(encoded[key])
+        per_user_bodies[user_id] = bodies
+    return per_user_bodies
 
-    event_name = os.environ.get("GITHUB_EVENT_NAME", "unknown")
-    action = event.get("action")
-    print(f"🔍 Event: {event_name} | Action: {action}")
+# --- BUILD CONTEXT ---
+# 1. Standard Pull Request
+def _build_pr_data(event):
+    pr = event["pull_request"]
+    return {
+        "type": "pr",
+        "title": pr["title"],
+        "url": pr["html_url"],
+        "repo": event["repository"]["full_name"],
+        "sender": event["sender"]["login"],
+        "avatar": event["sender"]["avatar_url"],
+        "author": pr["user"]["login"],
+        "head": pr["head"]["ref"],
+        "base": pr["base"]["ref"],
+        "merged": pr.get("merged", False)
+    }
+
+# 2. Review Submission (Approvals/Changes)
+def _build_review_data(event):
+    pr = event["pull_request"]
+    review = event["review"]
+    return {
+        "type": "review_submit",
+        "title": pr["title"],
+        "url": review["html_url"],
+        "repo": event["repository"]["full_name"],
+        "sender": review["user"]["login"], # The Reviewer
+        "avatar": review["user"]["avatar_url"],
+        "author": pr["user"]["login"],     # The PR Author (Target)
+        "head": pr["head"]["ref"],
+        "base": pr["base"]["ref"],
+        "state": review["state"].lower()   # approved, changes_requested, commented
+    }
+
+# 3. Comments (None for comments on plain issues)
+def _build_comment_data(event):
+    if "pull_request" not in event and "pull_request" not in event["issue"]:
+        return None
+    comment = event["comment"]
+    pr_source = event["pull_request"] if "pull_request" in event else event["issue"]
+    return {
+        "type": "comment",
+        "title": pr_source["title"],
+        "url": comment["html_url"],
+        "repo": event["repository"]["full_name"],
+        "sender": comment["user"]["login"],
+        "avatar": comment["user"]["avatar_url"],
+        "author": pr_source["user"]["login"],
+        "head": "", "base": "",
+        "body": comment["body"]
+    }
 
-    # --- BUILD CONTEXT ---
-    data = {}
-
-    # 1. Standard Pull Request
-    if event_name == "pull_request":
-        pr = event["pull_request"]
-        data = {
-            "type": "pr",
-            "title": pr["title"],
-            "url": pr["html_url"],
-            "repo": event["repository"]["full_name"],
-            "sender": event["sender"]["login"],
-            "avatar": event["sender"]["avatar_url"],
-            "author": pr["user"]["login"],
-            "head": pr["head"]["ref"],
-            "base": pr["base"]["ref"],
-            "merged": pr.get("merged", False)
-        }
-
-    # 2. Review Submission (Approvals/Changes) - NEW!
-    elif event_name == "pull_request_review":
-        pr = event["pull_request"]
-        review = event["review"]
-        data = {
-            "type": "review_submit",
-            "title": pr["title"],
-            "url": review["html_url"],
-            "repo": event["repository"]["full_name"],
-            "sender": review["user"]["login"], # The Reviewer
-            "avatar": review["user"]["avatar_url"],
-            "author": pr["user"]["login"],     # The PR Author (Target)
-            "head": pr["head"]["ref"],
-            "base": pr["base"]["ref"],
-            "state": review["state"].lower()   # approved, changes_requested, commented
-        }
-
-    # 3. Comments
-    elif event_name in ["issue_comment", "pull_request_review_comment"]:
-        if event_name == "issue_comment" and "pull_request" not in event["issue"]:
-            exit(0)
-        comment = event["comment"]
-        pr_source = event["pull_request"] if "pull_request" in event else event["issue"]
-        data = {
-            "type": "comment",
-            "title": pr_source["title"],
-            "url": comment["html_url"],
-            "repo": event["repository"]["full_name"],
-            "sender": comment["user"]["login"],
-            "avatar": comment["user"]["avatar_url"],
-            "author": pr_source["user"]["login"],
-            "head": "", "base": "",
-            "body": comment["body"]
-        }
+DATA_BUILDERS = {
+    "pull_request": _build_pr_data,
+    "pull_request_review": _build_review_data,
+    "issue_comment": _build_comment_data,
+    "pull_request_review_comment": _build_comment_data,
+}
+
+# --- RULES ---
+# Each rule is a (recipients, decorate) pair: recipients(event, data) says who
+# to DM, decorate(embed, data) is only called when somebody is left to DM.
+
+# 1. PR APPROVED / CHANGES REQUESTED
+def _review_submitted_recipients(event, data):
+    if data["state"] in ("approved", "changes_requested"):
+        return [data["author"]]
+    print("Skipping 'commented' review type (handled by comment logic)")
+    return []
+
+def _review_submitted_embed(embed, data):
+    if data["state"] == "approved":
+        embed["color"] = _COLOR_APPROVED
+        embed["description"] = "**✅ PR Approved!**"
+        embed["fields"].append({"name": "Reviewer", "value": f"Approved by {data['sender']}", "inline": False})
     else:
-        print(f"Skipping unsupported event: {event_name}")
-        exit(0)
+        embed["color"] = _COLOR_CHANGES
+        embed["description"] = "**⚠️ Changes Requested**"
+        embed["fields"].append({"name": "Reviewer", "value": f"{data['sender']} requested changes.", "inline": False})
+
+# 2. REVIEW REQUESTED
+def _review_requested_recipients(event, data):
+    if "requested_reviewer" in event:
+        return [event["requested_reviewer"]["login"]]
+    return []
+
+def _review_requested_embed(embed, data):
+    embed["color"] = _COLOR_INFO
+    embed["description"] = "**Review Requested**\nYou were requested to review this PR."
+
+# 3. ASSIGNED
+def _assigned_recipients(event, data):
+    if "assignee" in event and event["assignee"]:
+        return [event["assignee"]["login"]]
+    return []
+
+def _assigned_embed(embed, data):
+    embed["color"] = _COLOR_INFO
+    embed["description"] = "**Assigned to You**"
+
+# 4. CLOSED / MERGED
+def _closed_recipients(event, data):
+    return [data["author"]] if data["author"] != data["sender"] else []
+
+def _closed_embed(embed, data):
+    embed["color"] = _COLOR_MERGED if data["merged"] else _COLOR_CLOSED
+    embed["description"] = "**Your PR was Merged!**" if data["merged"] else "**Your PR was Closed** (Unmerged)"
+
+# 5. COMMENTS
+def _comment_recipients(event, data):
+    mentions = _MENTION_RE.findall(data["body"])
+    if data["author"] == data["sender"]:
+        return mentions
+    return [data["author"]] + mentions
 
-    # --- LOGIC: BUILD EMBED ---
-    recipients = []
+def _comment_embed(embed, data):
+    embed["color"] = _COLOR_COMMENT
+    embed["description"] = "**New Comment**"
+    body_preview = data["body"][:200] + "..." if len(data["body"]) > 200 else data["body"]
+    embed["fields"].append({"name": "Message", "value": body_preview, "inline": False})
 
+# Keyed by (event_name, action); an action of None matches any action
+RULE_HANDLERS = {
+    ("pull_request_review", None): (_review_submitted_recipients, _review_submitted_embed),
+    ("pull_request", "review_requested"): (_review_requested_recipients, _review_requested_embed),
+    ("pull_request", "assigned"): (_assigned_recipients, _assigned_embed),
+    ("pull_request", "closed"): (_closed_recipients, _closed_embed),
+    ("issue_comment", None): (_comment_recipients, _comment_embed),
+    ("pull_request_review_comment", None): (_comment_recipients, _comment_embed),
+}
+
+def get_rule(event_name, action):
+    return RULE_HANDLERS.get((event_name, action)) or RULE_HANDLERS.get((event_name, None))
+
+def build_embed(event_name, data):
     embed = {
+        **BASE_EMBED,
         "title": data["title"],
         "url": data["url"],
         "author": {
@@ -159,76 +368,129 @@ def main():
         "fields": [
             {"name": "📂 Repo", "value": data["repo"], "inline": True},
             {"name": "👤 Author", "value": data["author"], "inline": True}
-        ],
-        "footer": {"text": "GitHub Notification"}
+        ]
     }
 
     if data["head"]:
          embed["fields"].append({"name": "🌿 Branch", "value": f"`{data['head']}` ➝ `{data['base']}`", "inline": True})
+    return embed
 
-    # --- RULES ---
-
-    # 1. PR APPROVED / CHANGES REQUESTED (New Logic)
-    if event_name == "pull_request_review":
-        if data["state"] == "approved":
-            recipients.append(data["author"])
-            embed["color"] = COLORS["APPROVED"]
-            embed["description"] = "**✅ PR Approved!**"
-            embed["fields"].append({"name": "Reviewer", "value": f"Approved by {data['sender']}", "inline": False})
-
-        elif data["state"] == "changes_requested":
-            recipients.append(data["author"])
-            embed["color"] = COLORS["CHANGES"]
-            embed["description"] = "**⚠️ Changes Requested**"
-            embed["fields"].append({"name": "Reviewer", "value": f"{data['sender']} requested changes.", "inline": False})
+# --- EVENT HANDLING ---
+# Builds the embed for one event and returns the (discord_id, embed) DMs to send
+def handle_event(event, event_name, user_map):
+    action = event.get("action")
+    print(f"🔍 Event: {event_name} | Action: {action}")
 
-        else:
-            print("Skipping 'commented' review type (handled by comment logic)")
-
-    # 2. REVIEW REQUESTED
-    elif event_name == "pull_request" and action == "review_requested":
-        if "requested_reviewer" in event:
-            recipients.append(event["requested_reviewer"]["login"])
-            embed["color"] = COLORS["INFO"]
-            embed["description"] = "**Review Requested**\nYou were requested to review this PR."
-
-    # 3. ASSIGNED
-    elif event_name == "pull_request" and action == "assigned":
-        if "assignee" in event and event["assignee"]:
-             recipients.append(event["assignee"]["login"])
-             embed["color"] = COLORS["INFO"]
-             embed["description"] = "**Assigned to You**"
-
-    # 4. CLOSED / MERGED
-    elif event_name == "pull_request" and action == "closed":
-        if data["author"] != data["sender"]:
-            recipients.append(data["author"])
-        embed["color"] = COLORS["MERGED"] if data["merged"] else COLORS["CLOSED"]
-        embed["description"] = "**Your PR was Merged!**" if data["merged"] else "**Your PR was Closed** (Unmerged)"
-
-    # 5. COMMENTS
-    elif data.get("type") == "comment":
-        embed["color"] = COLORS["COMMENT"]
-        embed["description"] = "**New Comment**"
-        body_preview = data["body"][:200] + "..." if len(data["body"]) > 200 else data["body"]
-        embed["fields"].append({"name": "Message", "value": body_preview, "inline": False})
-
-        if data["author"] != data["sender"]:
-            recipients.append(data["author"])
-        mentions = re.findall(r"@([a-zA-Z0-9-]+)", data["body"])
-        recipients.extend(mentions)
+    builder = DATA_BUILDERS.get(event_name)
+    if builder is None:
+        print(f"Skipping unsupported event: {event_name}")
+        return []
+    # Actions without a rule (opened, synchronize, ...) reach nobody, so skip
+    # them before building the context
+    rule = get_rule(event_name, action)
+    if rule is None:
+        return []
+    data = builder(event)
+    if data is None:
+        return []
+    recipients_rule, embed_rule = rule
 
-    # --- SEND ---
-    unique_recipients = list(set(recipients))
+    # --- RECIPIENTS FIRST ---
+    # Most events reach nobody, so bail out before formatting an embed
+    recipients = recipients_rule(event, data)
+    discord_ids = []
+    # Ordered dedup, dropping the sender (don't DM yourself)
+    unique_recipients = [r for r in dict.fromkeys(recipients) if r != data["sender"]]
     for gh_user in unique_recipients:
-        if gh_user == data["sender"]: continue # Don't DM yourself
-
         discord_id = user_map.get(gh_user)
         if discord_id:
             print(f"🚀 Sending DM to {gh_user} ({discord_id})")
-            send_dm(discord_id, embed)
+            discord_ids.append(discord_id)
         else:
             print(f"⚠️ Skipping {gh_user}: No Discord ID mapped.")
+    if not discord_ids:
+        return []
+
+    embed = build_embed(event_name, data)
+    embed_rule(embed, data)
+    return [(discord_id, embed) for discord_id in discord_ids]
+
+# --- MAIN EXECUTION ---
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mapping-b64", help="Base64 encoded user mapping string")
+    parser.add_argument(
+        "--events-json",
+        help='JSON file with a batch of events: [{"event_name": ..., "payload": {...}}, ...]'
+    )
+    args = parser.parse_args()
+
+    # Load Mapping
+    user_map = load_user_map(args.mapping_b64) if args.mapping_b64 else {}
+
+    # Load Events
+    if args.events_json:
+        with open(args.events_json) as f:
+            batch = json.load(f)
+        if not isinstance(batch, list):
+            print(f"❌ Error: {args.events_json} must contain a JSON array of events.")
+            sys.exit(1)
+    else:
+        if "GITHUB_EVENT_PATH" not in os.environ:
+            print("❌ Error: GITHUB_EVENT_PATH not set.")
+            return
+
+        with open(os.environ["GITHUB_EVENT_PATH"]) as f:
+            event = json.load(f)
+        batch = [{"event_name": os.environ.get("GITHUB_EVENT_NAME", "unknown"), "payload": event}]
+
+    deliveries = []
+    failed = False
+    for item in batch:
+        event_name = "unknown"
+        try:
+            event_name = item.get("event_name", "unknown")
+            deliveries.extend(handle_event(item["payload"], event_name, user_map))
+        except Exception as e:
+            # One malformed payload must not drop the rest of the batch, but
+            # the job still fails once everything else has been sent
+            print(f"❌ Error handling {event_name} event: {e!r}")
+            failed = True
+
+    # Nothing to send: no sockets were opened and no file was written, so
+    # skip interpreter teardown (most events end up here)
+    if not deliveries:
+        sys.stdout.flush()
+        os._exit(1 if failed else 0)
+
+    # Only fail on a missing token when there is actually something to send
+    # (e.g. fork PRs run without secrets)
+    if not _TOKEN:
+        print("❌ Error: DISCORD_BOT_TOKEN not set.")
+        sys.exit(1)
+
+    # --- SEND ---
+    # Coalesce everything addressed to the same user into one DM
+    per_user = {}
+    for discord_id, embed in deliveries:
+        per_user.setdefault(discord_id, []).append(embed)
+
+    # DMs are independent and I/O bound, so overlap them. The pool is sized to
+    # the work, and the usual single-recipient run skips it entirely.
+    messages = list(encode_messages(per_user).items())
+    try:
+        if len(messages) == 1:
+            send_dm(*messages[0])
+        elif messages:
+            import concurrent.futures
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(messages))) as ex:
+                list(ex.map(lambda item: send_dm(*item), messages))
+    finally:
+        close_connections()
+
+    if failed:
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()